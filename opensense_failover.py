@@ -9,12 +9,25 @@ Gefixt + neu aufgebaut:
 """
 
 import requests
-from requests.auth import HTTPDigestAuth
+from requests.adapters import HTTPAdapter
+import hashlib
+import io
+import os
+import re
 import time
-import xml.etree.ElementTree as ET
+from lxml import etree as ET
 import logging
-import subprocess
+import orjson
+import select
+import socket
+import struct
+import threading
 import urllib3
+from xml.sax.saxutils import escape
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -55,10 +68,35 @@ FORWARDING_PORTS = [
 
 CHECK_INTERVAL = 5
 
+# So lange gilt der letzte bekannte Master noch, wenn kein Node erreichbar ist (Sekunden)
+MASTER_STALE_AFTER = 30
+
+# CARP-Advertisements (IP-Protokoll 112) – Master wird per Multicast erkannt statt gepollt
+CARP_MCAST_GROUP = "224.0.0.18"
+CARP_PROTO = 112
+# Nur Advertisements dieser VHID auswerten (None = alle). Bei mehreren VHIDs (LAN/WAN)
+# unbedingt setzen, sonst können beide Nodes gleichzeitig als Absender auftauchen.
+CARP_VHID = None
+
+# Versuche pro SOAP-Call, wenn die Fritzbox mit 503 drosselt
+SOAP_RETRIES = 3
+
+# UPnP-Fehlercode "NoSuchEntryInArray": abgefragtes Port-Mapping existiert nicht
+TR064_NO_SUCH_ENTRY = "714"
+
+# Parallele SOAP-Calls beim Failover (klein halten, die Fritzbox verträgt nicht viel)
+SOAP_WORKERS = 2
+
 # OPNsense API
 OPNSENSE_API_KEY = ""
 OPNSENSE_API_SECRET = "+AIF"
 
+# Interface-Status pro Node; {ip} wird durch die LAN-IP ersetzt
+OPNSENSE_API_URL = "http://{ip}/api/diagnostics/interface/getInterfaceConfig"
+
+# Idle-Verbindungen zur API vorher selbst schließen, bevor OPNsense sie kappt (Sekunden)
+OPNSENSE_IDLE_TTL = 55
+
 
 # ----------------------------------------------------------------------
 # LOGGING
@@ -70,56 +108,260 @@ logger = logging.getLogger(__name__)
 # ----------------------------------------------------------------------
 # Fritzbox TR-064 Client
 # ----------------------------------------------------------------------
+# (externer Port, Protokoll) → Port-Konfig, einmal beim Laden gebaut
+_FW_INDEX = {(c["external"], c["protocol"]): c for c in FORWARDING_PORTS}
+
+# Ports pro Node als frozenset – Lookup beim Failover in O(1)
+OPNSENSE_NODES = {ip: {**cfg, "ports": frozenset(cfg["ports"])} for ip, cfg in OPNSENSE_NODES.items()}
+
+# XPaths einmal beim Laden kompilieren statt pro SOAP-Antwort
+_ERROR_CODE_XPATH = ET.XPath("//*[local-name()='errorCode']")
+_ERROR_DESC_XPATH = ET.XPath("//*[local-name()='errorDescription']")
+
+# get_specific: Abfrage selbst fehlgeschlagen (≠ "Mapping existiert nicht" = None)
+LOOKUP_FAILED = object()
+
+# Nur diese Felder einer Mapping-Antwort werden gebraucht: TR-064-Tag → Key im Mapping-Dict
+_WANTED = {
+    "NewExternalPort": "ExternalPort",
+    "NewProtocol": "Protocol",
+    "NewInternalPort": "InternalPort",
+    "NewInternalClient": "InternalClient",
+    "NewEnabled": "Enabled",
+    "NewPortMappingDescription": "PortMappingDescription",
+}
+
+# Envelope ändert sich nie – nur die Action und ihre Argumente
+_SOAP_PREFIX = (
+    b'<?xml version="1.0" encoding="utf-8"?>\n'
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"'
+    b' s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    b'<s:Body>'
+)
+_SOAP_SUFFIX = b'</s:Body></s:Envelope>'
+
+
+def _soap_arg(k, v):
+    """<k>v</k> als Bytes, XML-escaped."""
+    return f"<{k}>{escape(str(v))}</{k}>".encode()
+
+
+# Ein Pool für alle SOAP-Calls – urllib3 direkt, ohne requests-Overhead pro Call.
+# Retries nur für Verbindungsfehler, 503 behandelt _soap selbst.
+_http = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=4,
+    block=False,
+    retries=Retry(total=2, backoff_factor=0.1),
+)
+_SOAP_TIMEOUT = urllib3.Timeout(connect=2, read=8)
+
+# Worker-Threads leben so lange wie das Script, statt pro Failover neu gestartet zu werden
+_soap_pool = ThreadPoolExecutor(max_workers=SOAP_WORKERS, thread_name_prefix="soap")
+
+# Alle Actions, die das Script benutzt
+_SOAP_ACTIONS = (
+    "GetGenericPortMappingEntry",
+    "GetSpecificPortMappingEntry",
+    "AddPortMapping",
+    "DeletePortMapping",
+)
+# (öffnendes, schließendes) Action-Element pro Action
+_SOAP_ACTION_TAGS = {
+    a: (f'<u:{a} xmlns:u="{FRITZ_WAN_SERVICE_TYPE}">'.encode(), f"</u:{a}>".encode())
+    for a in _SOAP_ACTIONS
+}
+
+
+_DIGEST_FIELD_RE = re.compile(r'(\w+)=(?:"([^"]*)"|([^\s,]+))')
+_DIGEST_HASHES = {"MD5": hashlib.md5, "SHA-256": hashlib.sha256}
+
+
+class _DigestAuth:
+    """
+    Minimaler HTTP-Digest (RFC 2617, qop=auth) für urllib3 – die Fritzbox kann nur Digest.
+    Die Nonce wird wiederverwendet, damit nicht jeder Call erst einen 401 kassiert.
+    Nicht threadsicher: nc muss in Sende-Reihenfolge steigen, daher eine Instanz pro Thread.
+    """
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self._chal = None
+        self._nc = 0
+
+    def challenge(self, www_authenticate):
+        """Challenge übernehmen. False wenn sie nicht Digest/unterstützt ist – dann kein Retry."""
+        self._chal = None
+        self._nc = 0
+
+        scheme, _, params = www_authenticate.partition(" ")
+        fields = {k: q or t for k, q, t in _DIGEST_FIELD_RE.findall(params)}
+
+        if scheme.lower() != "digest" or "realm" not in fields or "nonce" not in fields:
+            logger.error(f"✗ Auth-Challenge nicht unterstützt: {www_authenticate}")
+            return False
+
+        algorithm = fields.get("algorithm", "MD5")
+        if algorithm.upper() not in _DIGEST_HASHES:
+            logger.error(f"✗ Digest-Algorithmus nicht unterstützt: {algorithm}")
+            return False
+
+        if "qop" in fields and "auth" not in [q.strip() for q in fields["qop"].split(",")]:
+            logger.error(f"✗ Digest-qop nicht unterstützt: {fields['qop']}")
+            return False
+
+        self._chal = fields
+        return True
+
+    def header(self, method, uri):
+        """Authorization-Header für den nächsten Request, None solange keine gültige Challenge da ist."""
+        chal = self._chal
+        if chal is None:
+            return None
+        self._nc += 1
+        nc = self._nc
+
+        algorithm = chal.get("algorithm", "MD5")
+        h = _DIGEST_HASHES[algorithm.upper()]
+
+        def H(x):
+            return h(x.encode()).hexdigest()
+
+        ha1 = H(f"{self.username}:{chal['realm']}:{self.password}")
+        ha2 = H(f"{method}:{uri}")
+
+        parts = [
+            f'username="{self.username}"',
+            f'realm="{chal["realm"]}"',
+            f'nonce="{chal["nonce"]}"',
+            f'uri="{uri}"',
+            f"algorithm={algorithm}",
+        ]
+
+        if "qop" in chal:
+            cnonce = os.urandom(8).hex()
+            response = H(f"{ha1}:{chal['nonce']}:{nc:08x}:{cnonce}:auth:{ha2}")
+            parts += ["qop=auth", f"nc={nc:08x}", f'cnonce="{cnonce}"']
+        else:
+            # RFC 2069 ohne qop
+            response = H(f"{ha1}:{chal['nonce']}:{ha2}")
+
+        parts.append(f'response="{response}"')
+        if "opaque" in chal:
+            parts.append(f'opaque="{chal["opaque"]}"')
+
+        return "Digest " + ", ".join(parts)
+
+
 class FritzboxTR064:
 
     def __init__(self, ip, username, password):
         self.ip = ip
         self.port = 49000
-        self.auth = HTTPDigestAuth(username, password)
+        self.username = username
+        self.password = password
+
+        # ein Digest-State pro Worker-Thread – siehe auth
+        self._local = threading.local()
+
+        # URL + Header pro Action einmal bauen statt bei jedem Call
+        self._url = f"http://{ip}:{self.port}{FRITZ_WAN_SERVICE_PATH}"
+        self._headers = {
+            a: {
+                "Content-Type": 'text/xml; charset="utf-8"',
+                "SOAPAction": f"{FRITZ_WAN_SERVICE_TYPE}#{a}"
+            }
+            for a in _SOAP_ACTIONS
+        }
 
-    def _soap(self, action, args=None):
+    @property
+    def auth(self):
+        """Digest-State des aktuellen Threads (nc darf zwischen Threads nicht geteilt werden)."""
+        auth = getattr(self._local, "auth", None)
+        if auth is None:
+            auth = self._local.auth = _DigestAuth(self.username, self.password)
+        return auth
+
+    def _post(self, action, body):
+        headers = self._headers[action]
+        auth = self.auth.header("POST", FRITZ_WAN_SERVICE_PATH)
+        if auth:
+            headers = {**headers, "Authorization": auth}
+
+        r = _http.request("POST", self._url, body=body, headers=headers, timeout=_SOAP_TIMEOUT)
+
+        # erste Anfrage oder Nonce abgelaufen → Challenge übernehmen und einmal wiederholen
+        if r.status == 401 and "WWW-Authenticate" in r.headers:
+            if not self.auth.challenge(r.headers["WWW-Authenticate"]):
+                return r
+            headers = {**self._headers[action], "Authorization": self.auth.header("POST", FRITZ_WAN_SERVICE_PATH)}
+            r = _http.request("POST", self._url, body=body, headers=headers, timeout=_SOAP_TIMEOUT)
+
+        return r
+
+    def _call(self, action, args=None):
+        """SOAP-Request absetzen und die rohe Antwort liefern, egal mit welchem Status."""
         if args is None:
             args = {}
 
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"
- s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-  <s:Body>
-    <u:{action} xmlns:u="{FRITZ_WAN_SERVICE_TYPE}">
-"""
-
-        for k, v in args.items():
-            body += f"<{k}>{v}</{k}>\n"
+        open_tag, close_tag = _SOAP_ACTION_TAGS[action]
+        body = (
+            _SOAP_PREFIX
+            + open_tag
+            + b"".join([_soap_arg(k, v) for k, v in args.items()])
+            + close_tag
+            + _SOAP_SUFFIX
+        )
+
+        # Backoff nur wenn die Box wirklich drosselt (500 = normaler SOAP-Fault, kein Retry)
+        for attempt in range(SOAP_RETRIES):
+            r = self._post(action, body)
+            if r.status != 503 or attempt == SOAP_RETRIES - 1:
+                break
+            time.sleep(0.2 * 2 ** attempt)
 
-        body += f"""
-    </u:{action}>
-  </s:Body>
-</s:Envelope>
-"""
+        return r
 
-        headers = {
-            "Content-Type": 'text/xml; charset="utf-8"',
-            "SOAPAction": f"{FRITZ_WAN_SERVICE_TYPE}#{action}"
-        }
+    @staticmethod
+    def _fault(r):
+        # Fehler auslesen – (errorCode, errorDescription), beide None wenn nicht lesbar
+        try:
+            root = ET.fromstring(r.data)
+            err_code = _ERROR_CODE_XPATH(root)
+            err_desc = _ERROR_DESC_XPATH(root)
+        except:
+            return None, None
 
-        url = f"http://{self.ip}:{self.port}{FRITZ_WAN_SERVICE_PATH}"
+        if not err_code:
+            return None, None
+        return err_code[0].text, err_desc[0].text if err_desc else ''
 
-        r = requests.post(url, headers=headers, data=body, auth=self.auth, timeout=10)
+    def _soap(self, action, args=None):
+        r = self._call(action, args)
 
-        # Fehler auslesen
-        if r.status_code != 200:
-            try:
-                root = ET.fromstring(r.text)
-                err_code = root.find('.//{*}errorCode')
-                err_desc = root.find('.//{*}errorDescription')
-                if err_code is not None:
-                    logger.error(f"SOAP Error {err_code.text}: {err_desc.text if err_desc is not None else ''}")
-            except:
-                pass
+        if r.status != 200:
+            err_code, err_desc = self._fault(r)
+            if err_code is not None:
+                logger.error(f"SOAP Error {err_code}: {err_desc}")
             return None
 
         return r
 
+    # --------------------------------------------------------------
+    @staticmethod
+    def _parse_mapping(r):
+        # Streaming statt kompletter DOM – jedes Element direkt wieder freigeben
+        mapping = {}
+
+        for _, elem in ET.iterparse(io.BytesIO(r.data), events=("end",)):
+            key = _WANTED.get(elem.tag.rpartition("}")[2])
+            if key is not None and elem.text:
+                mapping[key] = elem.text
+            elem.clear()
+
+        return mapping
+
     # --------------------------------------------------------------
     def get_port_mappings(self):
         mappings = []
@@ -134,14 +376,7 @@ class FritzboxTR064:
                 break
 
             try:
-                root = ET.fromstring(r.text)
-                mapping = {}
-
-                for elem in root.findall(".//{*}*"):
-                    tag = elem.tag.split("}")[-1]
-                    if tag.startswith("New") and elem.text:
-                        mapping[tag.replace("New", "")] = elem.text
-
+                mapping = self._parse_mapping(r)
                 mapping["Index"] = idx
                 mappings.append(mapping)
                 idx += 1
@@ -152,6 +387,40 @@ class FritzboxTR064:
         logger.info(f"Gefunden: {len(mappings)} Port-Mappings")
         return mappings
 
+    # --------------------------------------------------------------
+    def get_specific(self, port, proto):
+        """
+        Einzelnes Mapping direkt abfragen (O(1) statt Liste durchlaufen).
+        Rückgabe: Mapping-Dict, None wenn der Port nicht gemappt ist, LOOKUP_FAILED bei Fehlern.
+        """
+        r = self._call("GetSpecificPortMappingEntry", {
+            "NewRemoteHost": "",
+            "NewExternalPort": port,
+            "NewProtocol": proto
+        })
+        if r.status != 200:
+            err_code, err_desc = self._fault(r)
+            if err_code == TR064_NO_SUCH_ENTRY:
+                # Port ist nicht gemappt – normaler Fall, kein Fehler
+                logger.debug(f"kein Mapping für {port}/{proto}")
+            else:
+                if err_code is not None:
+                    logger.error(f"SOAP Error {err_code}: {err_desc}")
+                else:
+                    logger.error(f"✗ HTTP {r.status} bei Abfrage {port}/{proto}")
+                return LOOKUP_FAILED
+            return None
+
+        try:
+            mapping = self._parse_mapping(r)
+        except ET.ParseError:
+            logger.error(f"✗ Antwort für {port}/{proto} nicht lesbar")
+            return LOOKUP_FAILED
+
+        mapping["ExternalPort"] = str(port)
+        mapping["Protocol"] = proto
+        return mapping
+
     # --------------------------------------------------------------
     def delete_mapping(self, port, proto):
         r = self._soap("DeletePortMapping", {
@@ -185,63 +454,274 @@ class FritzboxTR064:
             logger.error(f"✗ erstellen fehlgeschlagen {port}/{proto}")
             return False
 
+    # --------------------------------------------------------------
+    def _reconcile(self, cfg, want, master):
+        """
+        Bringt ein Mapping auf den Sollzustand want = (Ziel-IP, interner Port) oder None.
+        Rückgabe: "unchanged", "added", "deleted" oder "failed".
+        """
+        m = self.get_specific(cfg["external"], cfg["protocol"])
+
+        # Ist-Zustand unbekannt → nicht raten, sonst bleibt ein altes Mapping stehen
+        if m is LOOKUP_FAILED:
+            logger.error(f"✗ Abfrage fehlgeschlagen {cfg['external']}/{cfg['protocol']}")
+            return "failed"
+
+        if m is not None and want is not None \
+                and (m.get("InternalClient"), m.get("InternalPort")) == want and m.get("Enabled") == "1":
+            return "unchanged"
+
+        if m is not None and not self.delete_mapping(cfg["external"], cfg["protocol"]):
+            return "failed"
+
+        if want is None:
+            return "deleted" if m is not None else "unchanged"
+
+        if self.add_mapping(
+            port=cfg["external"],
+            wan_ip=master["wan_ip"],  # <-- FIXED: korrekte WAN-IP
+            internal=cfg["internal"],
+            proto=cfg["protocol"],
+            desc=f"{cfg['description']} ({master['hostname']})"
+        ):
+            return "added"
+        return "failed"
+
     # --------------------------------------------------------------
     def update_for_master(self, master):
         logger.info(f"=== Update für {master['hostname']} ===")
 
-        current = self.get_port_mappings()
-
-        # 1. Löschen unserer Ports
-        for cfg in FORWARDING_PORTS:
-            for m in current:
-                if str(cfg["external"]) == m.get("ExternalPort") and cfg["protocol"] == m.get("Protocol"):
-                    self.delete_mapping(cfg["external"], cfg["protocol"])
-                    time.sleep(0.3)
-
-        # 2. Neu erstellen – aber nur die Ports, die auf den Master gehören
-        ok = 0
+        # Sollzustand: nur die Ports, die auf den Master gehören
+        desired = {
+            key: (master["wan_ip"], str(cfg["internal"]))
+            for key, cfg in _FW_INDEX.items()
+            if cfg["external"] in master["ports"]
+        }
 
-        for cfg in FORWARDING_PORTS:
-            if cfg["external"] in master["ports"]:
-                if self.add_mapping(
-                    port=cfg["external"],
-                    wan_ip=master["wan_ip"],  # <-- FIXED: korrekte WAN-IP
-                    internal=cfg["internal"],
-                    proto=cfg["protocol"],
-                    desc=f"{cfg['description']} ({master['hostname']})"
-                ):
-                    ok += 1
-                time.sleep(0.3)
+        # Nur schreiben, wo Ist und Soll abweichen – Ports sind unabhängig, also parallel
+        results = list(_soap_pool.map(
+            lambda item: self._reconcile(item[1], desired.get(item[0]), master),
+            _FW_INDEX.items()
+        ))
 
-        logger.info(f"=== fertig: {ok} Regeln erstellt ===")
-        return ok > 0
+        logger.info(
+            f"=== fertig: {results.count('added')} erstellt, {results.count('deleted')} gelöscht, "
+            f"{results.count('unchanged')} unverändert, {results.count('failed')} fehlgeschlagen ==="
+        )
+        return "failed" not in results
 
 
 # ----------------------------------------------------------------------
 # MASTER ERMITTLUNG
 # ----------------------------------------------------------------------
+# TCP-Keepalive: tote Verbindungen fallen nach ~60s auf, statt erst beim nächsten Poll zu hängen
+_KEEPALIVE_OPTS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _val in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+    if hasattr(socket, _name):  # nicht auf jeder Plattform vorhanden
+        _KEEPALIVE_OPTS.append((socket.IPPROTO_TCP, getattr(socket, _name), _val))
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter mit TCP-Keepalive und begrenzter Leerlaufzeit: war der Pool länger
+    als idle_ttl unbenutzt, wird er vor dem nächsten Request geleert.
+    """
+
+    def __init__(self, idle_ttl=OPNSENSE_IDLE_TTL, **kwargs):
+        self.idle_ttl = idle_ttl
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + _KEEPALIVE_OPTS
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_used > self.idle_ttl:
+                self.poolmanager.clear()
+            self._last_used = now
+        return super().send(request, **kwargs)
+
+
+# Eine Session über alle Polls hinweg, damit Keep-Alive zwischen den Checks hält
+_opn_session = requests.Session()
+_opn_session.auth = (OPNSENSE_API_KEY, OPNSENSE_API_SECRET)
+_opn_session.verify = False
+_opn_session.headers["Connection"] = "keep-alive"
+_opn_session.mount("http://", _KeepAliveAdapter(pool_connections=4, pool_maxsize=8))
+_opn_session.mount("https://", _KeepAliveAdapter(pool_connections=4, pool_maxsize=8))
+
+# Probe-Threads werden über alle Polls wiederverwendet. Doppelte Node-Anzahl, damit ein
+# Nachzügler aus dem letzten Poll (max. 2s Timeout) den nächsten nicht blockiert.
+_probe_pool = ThreadPoolExecutor(max_workers=2 * len(OPNSENSE_NODES), thread_name_prefix="probe")
+
+
+# Fallback-Check prüft denselben Port, den auch der API-Call benutzt
+_api = urlsplit(OPNSENSE_API_URL)
+_OPN_API_PORT = _api.port or {"http": 80, "https": 443}[_api.scheme]
+del _api
+
+
+def _tcp_alive(ip, port=_OPN_API_PORT, timeout=0.5):
+    try:
+        s = socket.create_connection((ip, port), timeout=timeout)
+        s.close()
+        return True
+    except OSError:
+        return False
+
+
+def _is_carp_master(iface):
+    # "carp" ist je nach OPNsense-Version eine Liste von VHIDs oder ein einzelnes Dict
+    carp = iface.get("carp") if isinstance(iface, dict) else None
+    if isinstance(carp, dict):
+        carp = [carp]
+    return any(str(c.get("status", "")).upper() == "MASTER" for c in carp or () if isinstance(c, dict))
+
+
+def _probe(lan_ip, cfg):
+    """
+    Prüft einen Node. Rückgabe: (cfg, True) wenn die API CARP-MASTER meldet,
+    (cfg, False) wenn nur der TCP-Fallback antwortet, sonst None.
+    """
+    try:
+        url = OPNSENSE_API_URL.format(ip=lan_ip)
+        r = _opn_session.get(url, timeout=2)
+
+        if r.status_code == 200:
+            data = orjson.loads(r.content)
+            if any(_is_carp_master(iface) for iface in data.values()):
+                logger.info(f"✓ {cfg['hostname']} ist MASTER")
+                return cfg, True
+
+    except:
+        # fallback: TCP-Connect auf den API-Port (kein fork/exec wie bei ping)
+        if _tcp_alive(lan_ip):
+            return cfg, False
+
+    return None
+
+
 def check_opnsense_master():
-    for lan_ip, cfg in OPNSENSE_NODES.items():
+    # Alle Nodes parallel prüfen: Latenz = langsamster Node statt Summe aller Timeouts
+    fallback = {}
+
+    futures = {_probe_pool.submit(_probe, ip, cfg): ip for ip, cfg in OPNSENSE_NODES.items()}
+    try:
+        for f in as_completed(futures):
+            res = f.result()
+            if res is None:
+                continue
+
+            cfg, is_master = res
+            if is_master:
+                return cfg
+
+            fallback[futures[f]] = cfg
+    finally:
+        # nicht auf langsame Nodes warten, sobald der MASTER feststeht
+        for f in futures:
+            f.cancel()
+
+    # Kein Node meldet MASTER per API → erster per TCP erreichbarer Node (Reihenfolge wie konfiguriert)
+    for lan_ip in OPNSENSE_NODES:
+        if lan_ip in fallback:
+            cfg = fallback[lan_ip]
+            logger.info(f"✓ {cfg['hostname']} antwortet (TCP) → Fallback MASTER")
+            return cfg
+
+    return None
+
+
+# ----------------------------------------------------------------------
+# CARP LISTENER
+# ----------------------------------------------------------------------
+class CarpListener:
+    """
+    Lauscht auf CARP-Advertisements. Nur der MASTER sendet sie,
+    die Absender-IP verrät also den aktuellen Master.
+    Ein anderer Absender wird erst übernommen, wenn der bisherige Master
+    silence_limit lang geschwiegen hat – bei Preemption senden kurz beide.
+    Braucht root / CAP_NET_RAW – ohne bleibt es beim HTTP-Polling.
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.last_seen = None
+        self.master = None
+        # 3 × advbase; Default advbase = 1s, wird aus den Paketen nachgeführt
+        self.silence_limit = 3
+
+        self._nodes = {}
+        for lan_ip, cfg in OPNSENSE_NODES.items():
+            self._nodes[lan_ip] = cfg
+            self._nodes[cfg["wan_ip"]] = cfg
+
         try:
-            url = f"http://{lan_ip}/api/diagnostics/interface/getInterfaceConfig"
-            r = requests.get(url, auth=(OPNSENSE_API_KEY, OPNSENSE_API_SECRET), timeout=2, verify=False)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, CARP_PROTO)
+            mreq = struct.pack("4s4s", socket.inet_aton(CARP_MCAST_GROUP), socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            self.sock = sock
+            logger.info(f"✓ CARP-Listener aktiv ({CARP_MCAST_GROUP})")
+        except OSError as e:
+            logger.warning(f"CARP-Listener nicht verfügbar ({e}) → nur HTTP-Polling")
 
-            if r.status_code == 200:
-                data = r.json()
-                for iface in data.values():
-                    check = str(iface).lower()
-                    if "carp" in check and "master" in check:
-                        logger.info(f"✓ {cfg['hostname']} ist MASTER")
-                        return cfg
+    # --------------------------------------------------------------
+    def silent(self):
+        """True wenn länger als 3 × advbase kein Advertisement kam."""
+        if self.sock is None or self.last_seen is None:
+            return True
+        return time.monotonic() - self.last_seen > self.silence_limit
 
-        except:
-            # fallback: ping
-            p = subprocess.run(["ping", "-c", "1", "-W", "1", lan_ip], capture_output=True)
-            if p.returncode == 0:
-                logger.info(f"✓ {cfg['hostname']} antwortet (Ping) → Fallback MASTER")
+    # --------------------------------------------------------------
+    def wait(self, timeout):
+        """Blockiert bis zum nächsten Advertisement eines Nodes; liefert dessen cfg oder None."""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            ready, _, _ = select.select([self.sock], [], [], remaining)
+            if not ready:
+                return None
+
+            pkt, (src, _) = self.sock.recvfrom(2048)
+            cfg = self._parse(pkt, src)
+            if cfg is not None:
                 return cfg
 
-    return None
+    # --------------------------------------------------------------
+    def _parse(self, pkt, src):
+        # Raw-Socket liefert den IP-Header mit
+        ihl = (pkt[0] & 0x0F) * 4
+        if len(pkt) < ihl + 8:
+            return None
+
+        ver_type, vhid, advskew, _, _, advbase = pkt[ihl:ihl + 6]
+        if ver_type != 0x21:  # Version 2, Typ Advertisement
+            return None
+        if CARP_VHID is not None and vhid != CARP_VHID:
+            return None
+
+        cfg = self._nodes.get(src)
+        if cfg is None:
+            return None
+
+        # Wechsel nur, wenn der bisherige Master verstummt ist – sonst pendelt die Fritzbox
+        if cfg is not self.master and not self.silent():
+            logger.debug(f"CARP vhid={vhid} von {cfg['hostname']} ignoriert, {self.master['hostname']} sendet noch")
+            return None
+
+        self.master = cfg
+        self.last_seen = time.monotonic()
+        self.silence_limit = 3 * max(advbase, 1)
+        logger.debug(f"CARP vhid={vhid} advskew={advskew} von {cfg['hostname']}")
+        return cfg
 
 
 # ----------------------------------------------------------------------
@@ -258,22 +738,51 @@ def main():
     fb.get_port_mappings()
     logger.info("✓ Verbindung steht.\n")
 
+    carp = CarpListener()
     current = None
+    last_master_ts = 0.0
+    failures = 0
+    # nach fehlgeschlagenem Failover frühestens nach CHECK_INTERVAL erneut versuchen
+    retry_after = 0.0
 
     while True:
         try:
-            master = check_opnsense_master()
-
-            if master and master != current:
+            master = None
+            if carp.sock is not None:
+                master = carp.wait(CHECK_INTERVAL)
+
+            # HTTP-Probing nur wenn der Multicast-Feed schweigt
+            if master is None and carp.silent():
+                master = check_opnsense_master()
+
+                # Kurzer Aussetzer: letzten bekannten Master weiter gelten lassen
+                if master is None and current:
+                    failures += 1
+                    if time.monotonic() - last_master_ts >= MASTER_STALE_AFTER:
+                        logger.warning(
+                            f"⚠ Kein Node erreichbar ({failures} Checks) – "
+                            f"{current['hostname']} nicht mehr bestätigt"
+                        )
+                        current = None
+
+            if master:
+                failures = 0
+                last_master_ts = time.monotonic()
+
+            # CARP weckt die Schleife ~1×/s – ohne Backoff würde ein Fehlschlag sekündlich wiederholt
+            if master and master != current and time.monotonic() >= retry_after:
                 prev = current['hostname'] if current else "Keiner"
                 logger.info(f"🔄 FAILOVER: {prev} → {master['hostname']}")
+                retry_after = time.monotonic() + CHECK_INTERVAL
                 if fb.update_for_master(master):
                     current = master
+                    retry_after = 0.0
                     logger.info(f"✓ Failover abgeschlossen\n")
                 else:
                     logger.error("❌ Failover fehlgeschlagen\n")
 
-            time.sleep(CHECK_INTERVAL)
+            if carp.sock is None:
+                time.sleep(CHECK_INTERVAL)
 
         except KeyboardInterrupt:
             logger.info("Bye")